@@ -1,12 +1,22 @@
 import cv2
 from deepface import DeepFace
 import numpy as np
+import onnxruntime as ort
+import tensorflow as tf
+import faiss
 import os
 import csv
 from datetime import datetime
 import logging
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
+import queue
+import threading
+import hashlib
+import math
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -14,165 +24,718 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Configuration
 DATASET_PATH = "backend/uploads"
 MODEL_NAME = 'VGG-Face'
-DETECTOR_BACKEND = 'retinaface'
+DETECTOR_BACKEND = 'retinaface'  # Used for enrollment only
+# YuNet face detector for the live loop, from https://github.com/opencv/opencv_zoo/tree/main/models/face_detection_yunet
+LIVE_DETECTOR_MODEL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "face_detection_yunet_2023mar.onnx")
+LIVE_DETECTOR_SCORE_THRESHOLD = 0.9
 DISTANCE_THRESHOLD = 0.4
 FRAME_SCALE_FACTOR = 0.5
+FACE_INPUT_SIZE = (224, 224)  # VGG-Face input resolution
+# Exported once with export_vggface_onnx.py
+VGGFACE_ONNX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vggface.onnx")
+# Optional INT8 model produced by quantize_vggface.py, used when the FP32 model would run on CPU
+VGGFACE_INT8_ONNX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "vggface_int8.onnx")
+VGGFACE_INPUT_NAME = 'input'  # Input tensor name set by export_vggface_onnx.py
+MAX_BATCH_FACES = 8  # Largest face batch per inference call
+TRT_CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "trt_cache")
+_TRT_SHAPE = f"{FACE_INPUT_SIZE[0]}x{FACE_INPUT_SIZE[1]}x3"
+ONNX_PROVIDERS = [
+    ('TensorrtExecutionProvider', {
+        'trt_fp16_enable': True,
+        'trt_engine_cache_enable': True,
+        'trt_engine_cache_path': TRT_CACHE_PATH,
+        'trt_profile_min_shapes': f"{VGGFACE_INPUT_NAME}:1x{_TRT_SHAPE}",
+        'trt_profile_opt_shapes': f"{VGGFACE_INPUT_NAME}:{MAX_BATCH_FACES}x{_TRT_SHAPE}",
+        'trt_profile_max_shapes': f"{VGGFACE_INPUT_NAME}:{MAX_BATCH_FACES}x{_TRT_SHAPE}"
+    }),
+    'CUDAExecutionProvider',
+    'CPUExecutionProvider'
+]
 CAMERA_URL = 0  # Use 0 for webcam, or replace with your CCTV URL
+QUEUE_SIZE = 2  # Frames buffered between pipeline stages
+# Low-latency FFmpeg options for RTSP streams; must be set before the capture is opened
+RTSP_CAPTURE_OPTIONS = 'rtsp_transport;tcp|fflags;nobuffer|flags;low_delay'
+WINDOW_NAME = "CCTV Face Attendance"
+MOTION_SIZE = (64, 64)  # Resolution of the frame-difference check
+MOTION_THRESHOLD = 3.0  # Mean absolute grayscale difference below which the scene is static
+DETECT_EVERY_N_FRAMES = 10  # Run detection on every Nth frame, track the last boxes in between
+TRACK_IOU_THRESHOLD = 0.5  # Overlap at which a new detection is taken to be an already tracked face
+ATTENDANCE_FSYNC_EVERY = 10  # Force CSV rows to disk after this many writes
+ATTENDANCE_API_URL = 'http://localhost:5000/api/attendance/mark'
+ATTENDANCE_API_TIMEOUT = (0.5, 2.0)  # (connect, read) seconds
+# Lists the performance cores on Linux hybrid (P/E core) CPUs
+PERFORMANCE_CORES_PATH = "/sys/devices/cpu_core/cpus"
+ENROLL_MAX_WORKERS = 8  # Upper bound on threads embedding new student images
+# Kept out of DATASET_PATH, which the backend serves publicly
+EMBEDDING_CACHE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Shared keep-alive session for backend requests
+_session = requests.Session()
+_session.mount('http://', HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=Retry(total=1, backoff_factor=0.1)))
+
+# Attendance events waiting to be written to CSV and sent to the backend
+attendance_q = queue.Queue()
+
+def available_cpu_count():
+    """
+    Count the cores this process may run on, honouring any CPU affinity.
+
+    Returns:
+        int: Number of usable cores
+    """
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def pin_to_performance_cores():
+    """
+    Restrict the process to performance cores on Linux hybrid CPUs.
+
+    Does nothing on platforms without sched_setaffinity or CPUs without
+    separate performance cores.
+    """
+    if not hasattr(os, "sched_setaffinity") or not os.path.exists(PERFORMANCE_CORES_PATH):
+        return
+
+    try:
+        with open(PERFORMANCE_CORES_PATH) as f:
+            spec = f.read().strip()
+
+        # Parse a CPU list such as "0-7,16-23"
+        cores = set()
+        for part in spec.split(","):
+            first, _, last = part.partition("-")
+            cores.update(range(int(first), int(last or first) + 1))
+
+        # Never widen an affinity the operator already restricted (taskset, cpuset)
+        cores &= os.sched_getaffinity(0)
+        if not cores:
+            logging.info("No performance cores in the current CPU affinity; leaving it unchanged")
+            return
+
+        os.sched_setaffinity(0, cores)
+        logging.info(f"Pinned process to performance cores {sorted(cores)}")
+    except Exception as e:
+        logging.warning(f"Unable to pin process to performance cores: {str(e)}")
+
+def configure_tensorflow():
+    """
+    Let TensorFlow (used by RetinaFace during enrollment) use all available cores.
 
-def cosine_distance(a, b):
+    Must be called before any TensorFlow model is built.
     """
-    Calculate the cosine distance between two vectors.
+    tf.config.threading.set_intra_op_parallelism_threads(available_cpu_count())
+    tf.config.threading.set_inter_op_parallelism_threads(2)
+
+def _file_key(path):
+    """
+    Build a cache key from an image file's content.
 
     Args:
-        a (np.array): First vector
-        b (np.array): Second vector
+        path (str): Path to the image file
 
     Returns:
-        float: Cosine distance
+        str: Short SHA-1 hex digest of the file content
     """
-    return 1 - np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b))
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
 
-def load_known_faces(dataset_path):
+def embedding_cache_path(model_path):
+    """
+    Build the embedding cache path for a given embedding model.
+
+    Each model file gets its own cache, so switching between the FP32 and
+    INT8 models re-enrolls every student instead of mixing embedding spaces.
+
+    Args:
+        model_path (str): Path to the ONNX model producing the embeddings
+
+    Returns:
+        str: Path to the cache file
+    """
+    model_name = os.path.splitext(os.path.basename(model_path))[0]
+    return os.path.join(EMBEDDING_CACHE_DIR, f"representations_{model_name}_{DETECTOR_BACKEND}.npz")
+
+def _load_cache(path):
+    """
+    Load cached face embeddings from disk.
+
+    Args:
+        path (str): Path to the cache file
+
+    Returns:
+        dict: Mapping of file key to (name, embedding)
+    """
+    if not os.path.exists(path):
+        return {}
+
+    try:
+        with np.load(path, allow_pickle=False) as data:
+            return {str(key): (str(name), embedding) for key, name, embedding in zip(data['keys'], data['names'], data['embeddings'])}
+    except Exception as e:
+        logging.warning(f"Ignoring unreadable embedding cache {path}: {str(e)}")
+        return {}
+
+def _save_cache(path, cache):
+    """
+    Write face embeddings to disk, replacing the previous cache.
+
+    An empty cache removes the file.
+
+    Args:
+        path (str): Path to the cache file
+        cache (dict): Mapping of file key to (name, embedding)
+    """
+    keys = list(cache)
+    try:
+        if not keys:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+
+        with open(path, "wb") as f:
+            np.savez(
+                f,
+                keys=np.array(keys),
+                names=np.array([cache[key][0] for key in keys]),
+                embeddings=np.stack([cache[key][1] for key in keys]).astype(np.float32)
+            )
+    except Exception as e:
+        logging.warning(f"Unable to write embedding cache {path}: {str(e)}")
+
+def _embed_image(image_path, embedder):
+    """
+    Detect the enrolled face in a student image and embed it.
+
+    Args:
+        image_path (str): Path to the student image
+        embedder (VGGFaceEmbedder): Face embedding model
+
+    Returns:
+        np.array: Face embedding, or None if no face could be embedded
+    """
+    filename = os.path.basename(image_path)
+    try:
+        faces = DeepFace.extract_faces(image_path, detector_backend=DETECTOR_BACKEND, enforce_detection=False, align=True)
+        if faces:
+            return embedder.embed([faces[0]['face']])[0]
+        logging.warning(f"No face detected in {filename}")
+    except Exception as e:
+        logging.error(f"Error processing {filename}: {str(e)}")
+    return None
+
+def load_known_faces(dataset_path, embedder, cache_path=None):
     """
     Load known faces from the dataset directory.
 
+    Embeddings are cached on disk keyed by image content, so only new or
+    changed images are run through the detector and embedder.
+
     Args:
         dataset_path (str): Path to the directory containing student images
+        embedder (VGGFaceEmbedder): Face embedding model
+        cache_path (str): Path to the embedding cache file (default: derived from the embedder's model)
 
     Returns:
-        tuple: (known_faces list, student_names list)
+        tuple: (known_faces matrix of shape (N, D) with L2-normalized rows, student_names list)
     """
     known_faces = []
     student_names = []
 
     if not os.path.exists(dataset_path):
         logging.error(f"Dataset path {dataset_path} does not exist")
-        return known_faces, student_names
+        return np.empty((0, 0), dtype=np.float32), student_names
+
+    if cache_path is None:
+        cache_path = embedding_cache_path(embedder.model_path)
+    cache = _load_cache(cache_path)
+    cache_updated = False
+
+    pending = []
+    seen = set()
 
     for filename in os.listdir(dataset_path):
         if filename.endswith((".jpg", ".png", ".jpeg")):
             image_path = os.path.join(dataset_path, filename)
+            name = os.path.splitext(filename)[0]
             try:
-                result = DeepFace.represent(image_path, model_name=MODEL_NAME, detector_backend=DETECTOR_BACKEND, enforce_detection=False)
-                if result:
-                    known_faces.append(result[0]['embedding'])
-                    student_names.append(os.path.splitext(filename)[0])
-                    logging.info(f"Loaded face for {os.path.splitext(filename)[0]}")
-                else:
-                    logging.warning(f"No face detected in {filename}")
+                key = _file_key(image_path)
             except Exception as e:
                 logging.error(f"Error processing {filename}: {str(e)}")
+                continue
+
+            seen.add(key)
+            if key in cache:
+                known_faces.append(cache[key][1])
+                student_names.append(name)
+                logging.info(f"Loaded cached face for {name}")
+            else:
+                pending.append((image_path, name, key))
+
+    if pending:
+        # Build the detector up front so worker threads share one warm model
+        DeepFace.build_model(DETECTOR_BACKEND, task="face_detector")
+
+        with ThreadPoolExecutor(max_workers=min(ENROLL_MAX_WORKERS, available_cpu_count())) as ex:
+            embeddings = ex.map(lambda item: _embed_image(item[0], embedder), pending)
+            for (image_path, name, key), embedding in zip(pending, embeddings):
+                if embedding is None:
+                    continue
+                cache[key] = (name, embedding)
+                cache_updated = True
+                known_faces.append(embedding)
+                student_names.append(name)
+                logging.info(f"Loaded face for {name}")
+
+    # Drop embeddings of images that were removed or replaced
+    pruned = {key: cache[key] for key in seen if key in cache}
+    if cache_updated or len(pruned) != len(cache):
+        _save_cache(cache_path, pruned)
 
     logging.info(f"Loaded {len(student_names)} students from dataset")
+
+    if not known_faces:
+        return np.empty((0, 0), dtype=np.float32), student_names
+
+    # Stack and pre-normalize once so matching is a single matrix-vector product
+    known_faces = np.ascontiguousarray(np.stack(known_faces), dtype=np.float32)
+    known_faces /= np.linalg.norm(known_faces, axis=1, keepdims=True)
     return known_faces, student_names
 
+def create_live_detector():
+    """
+    Create the YuNet face detector used on live camera frames.
+
+    Returns:
+        cv2.FaceDetectorYN: Detector running on OpenCV's DNN module, or None if the model file is missing
+    """
+    if not os.path.exists(LIVE_DETECTOR_MODEL):
+        logging.error(f"Face detector model {LIVE_DETECTOR_MODEL} does not exist; download face_detection_yunet_2023mar.onnx from https://github.com/opencv/opencv_zoo/tree/main/models/face_detection_yunet")
+        return None
+
+    return cv2.FaceDetectorYN.create(LIVE_DETECTOR_MODEL, "", (320, 320), LIVE_DETECTOR_SCORE_THRESHOLD)
+
+def detect_faces(detector, image):
+    """
+    Detect and align faces in a BGR image with the live detector.
+
+    Each face is rotated so the eyes are level before cropping, matching
+    DeepFace's align=True behaviour.
+
+    Args:
+        detector (cv2.FaceDetectorYN): Detector from create_live_detector
+        image (np.array): BGR image
+
+    Returns:
+        list: Dicts with 'face' (RGB crop, float values in [0, 1]), 'facial_area' and 'confidence',
+        in the same layout as DeepFace.extract_faces
+    """
+    img_h, img_w = image.shape[:2]
+    detector.setInputSize((img_w, img_h))
+    _, faces = detector.detect(image)
+
+    if faces is None:
+        return []
+
+    detections = []
+    for face in faces:
+        x, y, w, h = (int(v) for v in face[:4])
+        # Clip both corners so boxes running off the edge are cut, not shifted
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + w, img_w), min(y + h, img_h)
+        x, y, w, h = x0, y0, x1 - x0, y1 - y0
+        if w <= 0 or h <= 0:
+            continue
+
+        # Landmarks 0 and 1 are the subject's right and left eye
+        right_eye, left_eye = face[4:6], face[6:8]
+        angle = math.degrees(math.atan2(left_eye[1] - right_eye[1], left_eye[0] - right_eye[0]))
+        center = (float(x + w / 2), float(y + h / 2))
+        rotation = cv2.getRotationMatrix2D(center, angle, 1.0)
+
+        # Warp straight into a crop-sized output instead of rotating the whole image
+        rotation[:, 2] -= (x, y)
+        aligned = cv2.warpAffine(image, rotation, (w, h))
+
+        crop = aligned[:, :, ::-1].astype(np.float32)
+        crop *= 1.0 / 255.0
+        detections.append({
+            'face': crop,
+            'facial_area': {'x': x, 'y': y, 'w': w, 'h': h},
+            'confidence': float(face[14])
+        })
+
+    return detections
+
+def preprocess_face(face, out=None):
+    """
+    Prepare a detected face crop for the recognition model.
+
+    Mirrors DeepFace.represent: RGB to BGR, aspect-preserving resize and
+    zero padding to FACE_INPUT_SIZE.
+
+    Args:
+        face (np.array): Face crop in RGB, float values in [0, 1]
+        out (np.array): Optional float32 (224, 224, 3) buffer to write into
+
+    Returns:
+        np.array: Float32 array of shape (224, 224, 3)
+    """
+    target_h, target_w = FACE_INPUT_SIZE
+    factor = min(target_h / face.shape[0], target_w / face.shape[1])
+    resized = cv2.resize(face, (int(face.shape[1] * factor), int(face.shape[0] * factor)))
+
+    if out is None:
+        out = np.empty((target_h, target_w, 3), dtype=np.float32)
+
+    # Only the padding around the resized face needs zeroing
+    h, w = resized.shape[:2]
+    pad_top = (target_h - h) // 2
+    pad_left = (target_w - w) // 2
+    out[:pad_top] = 0
+    out[pad_top + h:] = 0
+    out[pad_top:pad_top + h, :pad_left] = 0
+    out[pad_top:pad_top + h, pad_left + w:] = 0
+    out[pad_top:pad_top + h, pad_left:pad_left + w] = resized[:, :, ::-1]
+    return out
+
+class VGGFaceEmbedder:
+    """
+    VGG-Face embedding model running on ONNX Runtime.
+
+    Providers missing from the installed ONNX Runtime build are skipped, so
+    the same list runs on TensorRT, CUDA or CPU. Face crops are copied into
+    one preallocated batch buffer that is reused for every call.
+
+    Args:
+        model_path (str): Path to the exported VGG-Face ONNX model
+        providers (list): Preferred ONNX Runtime execution providers, as names or (name, options) tuples
+
+    Raises:
+        FileNotFoundError: If the model file does not exist
+    """
+
+    def __init__(self, model_path=VGGFACE_ONNX_PATH, providers=ONNX_PROVIDERS):
+        if not os.path.exists(model_path):
+            logging.error(f"Embedding model {model_path} does not exist; create it with export_vggface_onnx.py")
+            raise FileNotFoundError(model_path)
+
+        so = ort.SessionOptions()
+        so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        available = ort.get_available_providers()
+        providers = [p for p in providers if (p[0] if isinstance(p, tuple) else p) in available]
+        self.model_path = model_path
+        self.session = ort.InferenceSession(model_path, sess_options=so, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+        self.batch = np.empty((MAX_BATCH_FACES, FACE_INPUT_SIZE[0], FACE_INPUT_SIZE[1], 3), dtype=np.float32)
+        self.lock = threading.Lock()  # Guards self.batch when enrollment embeds from several threads
+        logging.info(f"Loaded {model_path} with providers {self.session.get_providers()}")
+
+    def embed(self, faces):
+        """
+        Compute embeddings for a batch of face crops, up to MAX_BATCH_FACES per session run.
+
+        Args:
+            faces (list): RGB face crops with float values in [0, 1]
+
+        Returns:
+            np.array: Embeddings of shape (F, D)
+        """
+        embeddings = []
+        with self.lock:
+            for start in range(0, len(faces), MAX_BATCH_FACES):
+                chunk = faces[start:start + MAX_BATCH_FACES]
+                for i, face in enumerate(chunk):
+                    preprocess_face(face, out=self.batch[i])
+                embeddings.append(self.session.run(None, {self.input_name: self.batch[:len(chunk)]})[0])
+        return np.concatenate(embeddings)
+
 def initialize_attendance(date_today):
     """
     Initialize the attendance file for the current date.
 
+    The file is opened once in append mode and kept open until main exits.
+
     Args:
         date_today (str): Current date in YYYY-MM-DD format
 
     Returns:
-        str: attendance_file path
+        tuple: (attendance_file path, open file handle, csv.writer on the handle)
     """
     attendance_file = f"attendance_{date_today}.csv"
+    is_new = not os.path.exists(attendance_file)
 
-    if not os.path.exists(attendance_file):
-        with open(attendance_file, "w", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow(["Name", "Date", "Time", "Status", "Class Period"])
+    handle = open(attendance_file, "a", newline="")
+    writer = csv.writer(handle)
+
+    if is_new:
+        writer.writerow(["Name", "Date", "Time", "Status", "Class Period"])
+        handle.flush()
         logging.info(f"Created new attendance file: {attendance_file}")
 
-    return attendance_file
+    return attendance_file, handle, writer
+
+def build_index(known_faces):
+    """
+    Build an inner-product FAISS index over the known face embeddings.
+
+    Args:
+        known_faces (np.array): L2-normalized known face embeddings of shape (N, D)
+
+    Returns:
+        faiss.IndexFlatIP: Index where inner product equals cosine similarity
+    """
+    index = faiss.IndexFlatIP(known_faces.shape[1])
+    index.add(known_faces)
+    return index
+
+def match(queries, index):
+    """
+    Find the closest known face for each query by cosine distance.
+
+    Args:
+        queries (np.array): Query embeddings of shape (F, D)
+        index (faiss.IndexFlatIP): Index from build_index
+
+    Returns:
+        tuple: (best match indices, cosine distances to them), each of shape (F,)
+    """
+    queries = np.array(queries, dtype=np.float32, order='C')
+    faiss.normalize_L2(queries)
+    sims, ids = index.search(queries, 1)
+    return ids[:, 0], 1.0 - sims[:, 0]
+
+def draw_faces(frame, faces):
+    """
+    Draw labelled boxes for recognized faces.
+
+    Args:
+        frame (np.array): Video frame
+        faces (list): (left, top, right, bottom, name) tuples in frame coordinates
+
+    Returns:
+        np.array: Frame with bounding boxes
+    """
+    for left, top, right, bottom, name in faces:
+        cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+        cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    return frame
+
+def start_tracks(frame, faces):
+    """
+    Start a KCF tracker for each recognized face.
 
-def process_frame(frame, known_faces, student_names, attendance_file, attendance_set, date_today, classPeriod=1):
+    Args:
+        frame (np.array): Video frame the faces were detected in
+        faces (list): (left, top, right, bottom, name) tuples in frame coordinates
+
+    Returns:
+        list: (tracker, name) tuples; faces whose tracker fails to start are left out
+    """
+    tracks = []
+    for left, top, right, bottom, name in faces:
+        try:
+            tracker = cv2.legacy.TrackerKCF_create()
+            tracker.init(frame, (left, top, right - left, bottom - top))
+        except cv2.error as e:
+            logging.warning(f"Unable to track {name}: {str(e)}")
+            continue
+        tracks.append((tracker, name))
+    return tracks
+
+def update_tracks(tracks, frame):
+    """
+    Propagate tracked faces to a new frame, dropping tracks that are lost.
+
+    Args:
+        tracks (list): (tracker, name) tuples from start_tracks
+        frame (np.array): New video frame
+
+    Returns:
+        tuple: (surviving tracks, list of (left, top, right, bottom, name) tuples)
+    """
+    alive = []
+    faces = []
+    for tracker, name in tracks:
+        try:
+            ok, (x, y, w, h) = tracker.update(frame)
+        except cv2.error as e:
+            logging.warning(f"Lost track of {name}: {str(e)}")
+            continue
+        if not ok:
+            continue
+        alive.append((tracker, name))
+        faces.append((int(x), int(y), int(x + w), int(y + h), name))
+    return alive, faces
+
+def box_iou(a, b):
+    """
+    Calculate the intersection over union of two boxes.
+
+    Args:
+        a (tuple): (left, top, right, bottom) box
+        b (tuple): (left, top, right, bottom) box
+
+    Returns:
+        float: Intersection over union in [0, 1]
+    """
+    inter_w = min(a[2], b[2]) - max(a[0], b[0])
+    inter_h = min(a[3], b[3]) - max(a[1], b[1])
+    if inter_w <= 0 or inter_h <= 0:
+        return 0.0
+    inter = inter_w * inter_h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union
+
+def tracked_name(box, tracked_faces, attendance_set):
+    """
+    Look up an already marked student whose tracked box overlaps a new detection.
+
+    Args:
+        box (tuple): (left, top, right, bottom) box of the new detection
+        tracked_faces (list): (left, top, right, bottom, name) tuples from the trackers
+        attendance_set (set): Set of already marked students
+
+    Returns:
+        str: Name of the tracked student, or None if the face must be embedded
+    """
+    for face in tracked_faces:
+        if face[4] in attendance_set and box_iou(box, face[:4]) >= TRACK_IOU_THRESHOLD:
+            return face[4]
+    return None
+
+def process_frame(frame, detector, embedder, index, student_names, attendance_set, date_today, classPeriod=1, tracked_faces=()):
     """
     Process a single frame for face detection and recognition.
 
+    Detections overlapping a tracked face of an already marked student
+    reuse that name instead of being embedded again.
+
     Args:
         frame (np.array): Video frame
-        known_faces (list): List of known face embeddings
+        detector (cv2.FaceDetectorYN): Live face detector
+        embedder (VGGFaceEmbedder): Face embedding model
+        index (faiss.IndexFlatIP): Index of known face embeddings
         student_names (list): List of student names
-        attendance_file (str): Path to attendance file
         attendance_set (set): Set of already marked students
         date_today (str): Current date
         classPeriod (int): Class period number (default 1)
+        tracked_faces (list): (left, top, right, bottom, name) tuples from the trackers
 
     Returns:
-        np.array: Processed frame with bounding boxes
+        list: (left, top, right, bottom, name) tuples in frame coordinates; the frame itself is left unannotated
     """
-    # Resize for faster processing
-    small_frame = cv2.resize(frame, (0, 0), fx=FRAME_SCALE_FACTOR, fy=FRAME_SCALE_FACTOR)
-    rgb_small_frame = cv2.cvtColor(small_frame, cv2.COLOR_BGR2RGB)
+    faces = []
+
+    # Resize for faster processing; the detector works on BGR directly
+    if FRAME_SCALE_FACTOR == 1.0:
+        small_frame = frame
+    else:
+        small_frame = cv2.resize(frame, None, fx=FRAME_SCALE_FACTOR, fy=FRAME_SCALE_FACTOR, interpolation=cv2.INTER_AREA)
 
     try:
-        # Detect and represent faces
-        results = DeepFace.represent(rgb_small_frame, model_name=MODEL_NAME, detector_backend=DETECTOR_BACKEND, enforce_detection=False)
+        # Detect faces once, then embed all crops in a single batch
+        detections = detect_faces(detector, small_frame)
+
+        if not detections:
+            return faces
+
+        # Scale boxes back to frame coordinates and reuse names of tracked, marked students
+        pending = []
+        for detection in detections:
+            facial_area = detection['facial_area']
+            x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
+            box = (int(x / FRAME_SCALE_FACTOR), int(y / FRAME_SCALE_FACTOR), int((x + w) / FRAME_SCALE_FACTOR), int((y + h) / FRAME_SCALE_FACTOR))
 
-        if not results:
-            return frame
+            name = tracked_name(box, tracked_faces, attendance_set)
+            if name is None:
+                pending.append((detection, box))
+            else:
+                faces.append(box + (name,))
 
-        # Process each detected face
-        for result in results:
-            face_encoding = result['embedding']
-            facial_area = result['facial_area']
+        if not pending:
+            return faces
 
-            # Compute distances to all known faces
-            distances = [cosine_distance(face_encoding, known) for known in known_faces]
-            min_distance = min(distances)
-            best_match_index = distances.index(min_distance)
+        embeddings = embedder.embed([detection['face'] for detection, _ in pending])
+        best_match_indices, min_distances = match(embeddings, index)
 
+        # Process each newly embedded face
+        for (_, box), best_match_index, min_distance in zip(pending, best_match_indices, min_distances):
             if min_distance < DISTANCE_THRESHOLD:
                 name = student_names[best_match_index]
             else:
                 name = "Unknown"
 
-            # Draw box around face
-            x, y, w, h = facial_area['x'], facial_area['y'], facial_area['w'], facial_area['h']
-            left, top, right, bottom = int(x / FRAME_SCALE_FACTOR), int(y / FRAME_SCALE_FACTOR), int((x + w) / FRAME_SCALE_FACTOR), int((y + h) / FRAME_SCALE_FACTOR)
-            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-            cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+            faces.append(box + (name,))
 
             # Mark attendance if recognized
             if name != "Unknown":
-                mark_attendance(name, date_today, attendance_file, attendance_set, classPeriod)
+                mark_attendance(name, date_today, attendance_set, classPeriod)
 
     except Exception as e:
         logging.error(f"Error processing frame: {str(e)}")
 
-    return frame
+    return faces
 
-def mark_attendance(rollNumber, date_today, attendance_file, attendance_set, classPeriod=1):
+def mark_attendance(rollNumber, date_today, attendance_set, classPeriod=1):
     """
     Mark attendance for a recognized student.
 
+    The CSV backup and backend request are handled by attendance_worker so
+    the frame loop never blocks on disk or network I/O.
+
     Args:
         rollNumber (str): Roll number of the student
         date_today (str): Current date
-        attendance_file (str): Path to attendance file
         attendance_set (set): Set of already marked students
         classPeriod (int): Class period number (default 1)
     """
     if rollNumber not in attendance_set:
         now = datetime.now()
         time_str = now.strftime("%H:%M:%S")
-        # Save to CSV as backup
-        with open(attendance_file, "a", newline="") as f:
-            writer = csv.writer(f)
-            writer.writerow([rollNumber, date_today, time_str, "Present", f"Class {classPeriod}"])
         attendance_set.add(rollNumber)
+        attendance_q.put({
+            'rollNumber': rollNumber,
+            'date': date_today,
+            'time': time_str,
+            'status': 'present',
+            'classPeriod': classPeriod
+        })
         logging.info(f"Marked {rollNumber} as Present in Class {classPeriod} at {time_str}")
 
+def attendance_worker(handle, writer, events):
+    """
+    Write queued attendance events to the CSV backup and send them to the backend.
+
+    Runs until a None event is received. Rows are flushed once the queue
+    drains and fsynced every ATTENDANCE_FSYNC_EVERY rows.
+
+    Args:
+        handle (file): Open attendance file handle
+        writer (csv.writer): CSV writer on the handle
+        events (queue.Queue): Queue of attendance events from mark_attendance
+    """
+    rows = 0
+
+    while True:
+        event = events.get()
+        if event is None:
+            break
+
+        rollNumber, classPeriod = event['rollNumber'], event['classPeriod']
+
+        # Save to CSV as backup
+        writer.writerow([rollNumber, event['date'], event['time'], "Present", f"Class {classPeriod}"])
+        rows += 1
+        if rows % ATTENDANCE_FSYNC_EVERY == 0:
+            handle.flush()
+            os.fsync(handle.fileno())
+        elif events.empty():
+            handle.flush()
+
         # Send to backend API
         try:
-            response = requests.post('http://localhost:5000/api/attendance/mark', json={
-                'rollNumber': rollNumber,
-                'date': date_today,
-                'time': time_str,
-                'status': 'present',
-                'classPeriod': classPeriod
-            })
+            response = _session.post(ATTENDANCE_API_URL, json=event, timeout=ATTENDANCE_API_TIMEOUT)
             if response.status_code == 200:
                 logging.info(f"Sent attendance for {rollNumber} (Class {classPeriod}) to backend")
             else:
@@ -180,20 +743,150 @@ def mark_attendance(rollNumber, date_today, attendance_file, attendance_set, cla
         except Exception as e:
             logging.error(f"Error sending attendance to backend: {str(e)}")
 
+def put_latest(q, item):
+    """
+    Put an item on a bounded queue, dropping the oldest entry when full.
+
+    Args:
+        q (queue.Queue): Bounded queue
+        item: Item to enqueue
+    """
+    while True:
+        try:
+            q.put_nowait(item)
+            return
+        except queue.Full:
+            try:
+                q.get_nowait()
+            except queue.Empty:
+                pass
+
+def open_camera(url):
+    """
+    Open the camera with a minimal driver buffer so frames stay close to real time.
+
+    Args:
+        url (int or str): Webcam index or stream URL
+
+    Returns:
+        cv2.VideoCapture: Camera capture
+    """
+    if isinstance(url, str):
+        if url.startswith("rtsp://"):
+            os.environ.setdefault('OPENCV_FFMPEG_CAPTURE_OPTIONS', RTSP_CAPTURE_OPTIONS)
+        cap = cv2.VideoCapture(url, cv2.CAP_FFMPEG)
+    else:
+        cap = cv2.VideoCapture(url)
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*'MJPG'))
+
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return cap
+
+def read_frames(cap, read_q, stop_event):
+    """
+    Reader stage: pull frames from the camera so the buffer always holds the freshest frame.
+
+    Frames are only decoded when the processing stage has room for them;
+    otherwise they are grabbed and discarded.
+
+    Puts None on the queue when the camera stops delivering frames, and
+    releases the capture on exit so it is never released under a live grab.
+
+    Args:
+        cap (cv2.VideoCapture): Opened camera
+        read_q (queue.Queue): Queue feeding the processing stage
+        stop_event (threading.Event): Set to stop the pipeline
+    """
+    try:
+        while not stop_event.is_set():
+            if not cap.grab():
+                logging.error("Unable to read frame from camera")
+                break
+
+            if read_q.full():
+                continue
+
+            ret, frame = cap.retrieve()
+            if not ret:
+                logging.error("Unable to read frame from camera")
+                break
+            put_latest(read_q, frame)
+    finally:
+        cap.release()
+        put_latest(read_q, None)
+
+def display_frames(show_q, stop_event, quit_event):
+    """
+    Display stage: show processed frames and watch for the quit key.
+
+    Args:
+        show_q (queue.Queue): Queue of processed frames
+        stop_event (threading.Event): Set to stop the pipeline
+        quit_event (threading.Event): Set when the user presses 'q'
+    """
+    while not stop_event.is_set():
+        try:
+            frame = show_q.get(timeout=1)
+        except queue.Empty:
+            continue
+
+        cv2.imshow(WINDOW_NAME, frame)
+
+        if cv2.waitKey(1) & 0xFF == ord("q"):
+            quit_event.set()
+            stop_event.set()
+
+    cv2.destroyAllWindows()
+
 def main():
     """
     Main function to run the face attendance system with automatic restart and class period alternation.
     """
+    pin_to_performance_cores()
+    configure_tensorflow()
+
+    # Build the detector and recognition model once and reuse them for every frame
+    detector = create_live_detector()
+    if detector is None:
+        logging.error("No face detector available. Exiting.")
+        return
+
+    # KCF trackers only ship with opencv-contrib; without them detect on every moving frame
+    tracking = hasattr(cv2, 'legacy')
+    detect_every = DETECT_EVERY_N_FRAMES if tracking else 1
+    if not tracking:
+        logging.warning("cv2.legacy is unavailable (install opencv-contrib-python); face tracking disabled, detecting on every frame")
+
+    try:
+        embedder = VGGFaceEmbedder()
+
+        # Providers can be listed without a usable device, so decide from the session actually built
+        active_provider = embedder.session.get_providers()[0]
+        if active_provider == 'CPUExecutionProvider' and os.path.exists(VGGFACE_INT8_ONNX_PATH):
+            logging.info(f"FP32 model is running on CPU; using INT8 model {VGGFACE_INT8_ONNX_PATH}")
+            embedder = VGGFaceEmbedder(VGGFACE_INT8_ONNX_PATH, providers=['CPUExecutionProvider'])
+        else:
+            logging.info(f"Using FP32 model {VGGFACE_ONNX_PATH} on {active_provider}")
+    except FileNotFoundError:
+        logging.error("No embedding model available. Exiting.")
+        return
+
     # Load known faces
-    known_faces, student_names = load_known_faces(DATASET_PATH)
+    known_faces, student_names = load_known_faces(DATASET_PATH, embedder)
 
-    if not known_faces:
+    if len(known_faces) == 0:
         logging.error("No known faces loaded. Exiting.")
         return
 
+    index = build_index(known_faces)
+
     # Initialize attendance file (only once per day)
     date_today = datetime.now().strftime("%Y-%m-%d")
-    attendance_file = initialize_attendance(date_today)
+    _, attendance_handle, attendance_writer = initialize_attendance(date_today)
+
+    # Background writer for the CSV backup and backend requests
+    attendance_thread = threading.Thread(target=attendance_worker, args=(attendance_handle, attendance_writer, attendance_q), daemon=True)
+    attendance_thread.start()
 
     # Class period alternation (1 to 6)
     class_period = 1
@@ -214,39 +907,76 @@ def main():
             attendance_set = set()
 
             # Open camera
-            cap = cv2.VideoCapture(CAMERA_URL)
+            cap = open_camera(CAMERA_URL)
 
             if not cap.isOpened():
                 logging.error("Unable to access camera feed")
                 time.sleep(60)  # Wait before retrying
                 continue
 
+            # Reader -> processor (this thread) -> display pipeline
+            read_q = queue.Queue(maxsize=QUEUE_SIZE)
+            show_q = queue.Queue(maxsize=QUEUE_SIZE)
+            stop_event = threading.Event()
+            quit_event = threading.Event()
+            reader = threading.Thread(target=read_frames, args=(cap, read_q, stop_event), daemon=True)
+            display = threading.Thread(target=display_frames, args=(show_q, stop_event, quit_event), daemon=True)
+            reader.start()
+            display.start()
+
+            # Motion gating state: grayscale thumbnail of the last processed frame
+            prev_gray = None
+            last_faces = []
+            tracks = []
+            frame_idx = 0
+
             start_time = time.time()
             logging.info("Running attendance for 1 minute.")
 
             try:
-                while True:
-                    ret, frame = cap.read()
-                    if not ret:
-                        logging.error("Unable to read frame from camera")
-                        break
+                while not stop_event.is_set():
+                    try:
+                        frame = read_q.get(timeout=1)
+                    except queue.Empty:
+                        continue
 
-                    # Process frame for multiple faces
-                    processed_frame = process_frame(frame, known_faces, student_names, attendance_file, attendance_set, date_today, class_period)
-
-                    cv2.imshow("CCTV Face Attendance", processed_frame)
+                    if frame is None:
+                        break
 
-                    if cv2.waitKey(1) & 0xFF == ord("q"):
-                        return
+                    # Skip inference when the scene has not changed since the last processed frame
+                    gray = cv2.cvtColor(cv2.resize(frame, MOTION_SIZE), cv2.COLOR_BGR2GRAY)
+                    static = prev_gray is not None and cv2.absdiff(gray, prev_gray).mean() < MOTION_THRESHOLD
+
+                    if static:
+                        processed_frame = draw_faces(frame, last_faces)
+                    elif frame_idx % detect_every:
+                        # Follow the faces from the last detection without running DeepFace
+                        tracks, last_faces = update_tracks(tracks, frame)
+                        processed_frame = draw_faces(frame, last_faces)
+                    else:
+                        # Process frame for multiple faces; trackers must start on the clean frame
+                        last_faces = process_frame(frame, detector, embedder, index, student_names, attendance_set, date_today, class_period, last_faces)
+                        tracks = start_tracks(frame, last_faces) if tracking else []
+                        processed_frame = draw_faces(frame, last_faces)
+                        prev_gray = gray
+                    frame_idx += 1
+
+                    put_latest(show_q, processed_frame)
 
                     if time.time() - start_time > 60:  # Run for 1 minute
                         break
+
+                if quit_event.is_set():
+                    return
             except KeyboardInterrupt:
                 logging.info("Interrupted by user")
                 return
             finally:
-                cap.release()
-                cv2.destroyAllWindows()
+                stop_event.set()
+                reader.join(timeout=2)
+                if reader.is_alive():
+                    logging.warning("Camera read still blocked; it will be released once the read returns")
+                display.join(timeout=2)
 
             # Attendance automatically sent during processing
             logging.info(f"Completed Class Period {class_period} attendance cycle {cycle_count}")
@@ -267,6 +997,10 @@ def main():
     except Exception as e:
         logging.error(f"Error in main loop: {str(e)}")
     finally:
+        # Drain pending attendance events before exiting
+        attendance_q.put(None)
+        attendance_thread.join()
+        attendance_handle.close()
         logging.info("Face attendance system stopped.")
         logging.info("All class periods (1-6) have been completed.")
 
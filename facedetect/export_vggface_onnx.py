@@ -0,0 +1,25 @@
+import logging
+import tensorflow as tf
+import tf2onnx
+from deepface import DeepFace
+
+from attendance import MODEL_NAME, FACE_INPUT_SIZE, VGGFACE_ONNX_PATH, VGGFACE_INPUT_NAME
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+def export_vggface(output_path=VGGFACE_ONNX_PATH, opset=14):
+    """
+    Export DeepFace's VGG-Face Keras model to ONNX with a dynamic batch axis.
+
+    Args:
+        output_path (str): Destination of the ONNX model
+        opset (int): ONNX opset version
+    """
+    model = DeepFace.build_model(MODEL_NAME).model
+    spec = (tf.TensorSpec((None, FACE_INPUT_SIZE[0], FACE_INPUT_SIZE[1], 3), tf.float32, name=VGGFACE_INPUT_NAME),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=opset, output_path=output_path)
+    logging.info(f"Exported {MODEL_NAME} to {output_path}")
+
+if __name__ == "__main__":
+    export_vggface()
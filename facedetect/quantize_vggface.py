@@ -0,0 +1,118 @@
+import os
+import sys
+import logging
+import numpy as np
+from deepface import DeepFace
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+from attendance import DATASET_PATH, DETECTOR_BACKEND, VGGFACE_ONNX_PATH, VGGFACE_INT8_ONNX_PATH, VGGFACE_INPUT_NAME, VGGFaceEmbedder, preprocess_face
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+MAX_QUANT_DISTANCE = 0.05  # Max cosine distance between FP32 and INT8 embeddings
+
+def load_enrollment_crops(dataset_path):
+    """
+    Detect and crop the enrolled face in every student image.
+
+    Args:
+        dataset_path (str): Path to the directory containing student images
+
+    Returns:
+        list: (student name, RGB face crop) tuples
+    """
+    crops = []
+    for filename in sorted(os.listdir(dataset_path)):
+        if filename.endswith((".jpg", ".png", ".jpeg")):
+            try:
+                faces = DeepFace.extract_faces(os.path.join(dataset_path, filename), detector_backend=DETECTOR_BACKEND, enforce_detection=False, align=True)
+                if faces:
+                    crops.append((os.path.splitext(filename)[0], faces[0]['face']))
+            except Exception as e:
+                logging.error(f"Error processing {filename}: {str(e)}")
+    return crops
+
+class EnrollCropReader(CalibrationDataReader):
+    """
+    Calibration data reader feeding enrolled face crops one at a time.
+
+    Args:
+        crops (list): (student name, RGB face crop) tuples
+        input_name (str): Name of the model input
+    """
+
+    def __init__(self, crops, input_name=VGGFACE_INPUT_NAME):
+        self.input_name = input_name
+        self.batches = iter([preprocess_face(face)[np.newaxis] for _, face in crops])
+
+    def get_next(self):
+        batch = next(self.batches, None)
+        return None if batch is None else {self.input_name: batch}
+
+def cosine_distance(a, b):
+    """
+    Calculate the cosine distance between two vectors.
+
+    Args:
+        a (np.array): First vector
+        b (np.array): Second vector
+
+    Returns:
+        float: Cosine distance
+    """
+    return 1 - float(np.dot(a, b) / (np.linalg.norm(a) * np.linalg.norm(b)))
+
+def verify_quantized(crops, fp32_path, int8_path):
+    """
+    Check that INT8 embeddings stay close to FP32 embeddings for every student.
+
+    Args:
+        crops (list): (student name, RGB face crop) tuples
+        fp32_path (str): Path to the FP32 model
+        int8_path (str): Path to the INT8 model
+
+    Returns:
+        bool: True if every student is within MAX_QUANT_DISTANCE
+    """
+    fp32 = VGGFaceEmbedder(fp32_path, providers=['CPUExecutionProvider'])
+    int8 = VGGFaceEmbedder(int8_path, providers=['CPUExecutionProvider'])
+
+    ok = True
+    for name, face in crops:
+        distance = cosine_distance(fp32.embed([face])[0], int8.embed([face])[0])
+        if distance < MAX_QUANT_DISTANCE:
+            logging.info(f"{name}: FP32/INT8 distance {distance:.4f}")
+        else:
+            logging.error(f"{name}: FP32/INT8 distance {distance:.4f} exceeds {MAX_QUANT_DISTANCE}")
+            ok = False
+    return ok
+
+def main():
+    """
+    Quantize the VGG-Face ONNX model to INT8 using enrolled faces for calibration.
+    """
+    crops = load_enrollment_crops(DATASET_PATH)
+    if not crops:
+        logging.error("No enrolled faces available for calibration. Exiting.")
+        return 1
+
+    quantize_static(
+        model_input=VGGFACE_ONNX_PATH,
+        model_output=VGGFACE_INT8_ONNX_PATH,
+        calibration_data_reader=EnrollCropReader(crops),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8
+    )
+    logging.info(f"Wrote quantized model to {VGGFACE_INT8_ONNX_PATH}")
+
+    if not verify_quantized(crops, VGGFACE_ONNX_PATH, VGGFACE_INT8_ONNX_PATH):
+        logging.error("Quantized model drifts too far from FP32; removing it.")
+        os.remove(VGGFACE_INT8_ONNX_PATH)
+        return 1
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())